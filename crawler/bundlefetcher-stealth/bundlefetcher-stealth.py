@@ -1,5 +1,4 @@
 import asyncio
-import json
 import os
 import pickle
 import sys
@@ -7,6 +6,7 @@ import time
 
 import aio_pika.exceptions
 import aiohttp
+import orjson
 import pipeline
 
 QUEUE_NAME_IN = os.getenv("QUEUE_NAME_IN")
@@ -17,52 +17,62 @@ PORT = int(os.getenv("PORT", "5444"))
 
 i = 0
 
+session = None
+
+
+def get_session():
+    # One pooled session shared by all workers, so the TCP connections to
+    # the local puppeteer backend stay warm across requests
+    global session
+    if session is None:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=0, limit_per_host=MAX_PARALLEL_COUNTER * 4, keepalive_timeout=60, force_close=False
+            )
+        )
+    return session
+
 
 async def bundlefetcher_stealth(queue, publish):
     global i
 
     j = (i := i + 1)
     print(f"Starting bundlefetcher_stealth worker{j}", file=sys.stderr)
+    client = get_session()
     try:
-        while True:
-            async with aiohttp.ClientSession() as client:
-                restart = False
-                while not restart:
-                    try:
-                        message = await queue.get()
-                    except aio_pika.exceptions.QueueEmpty:
-                        await asyncio.sleep(4)
-                        continue
-
-                    async with message.process(ignore_processed=True):
-                        domain = pipeline.deserialize(message.body)
-                        print(f"Processing domain {domain}", file=sys.stderr)
+        # Push delivery instead of polling with a 4s idle sleep
+        async with queue.iterator() as messages:
+            async for message in messages:
+                async with message.process(ignore_processed=True):
+                    domain = pipeline.deserialize(message.body)
+                    print(f"Processing domain {domain}", file=sys.stderr)
 
-                        done = False
-                        while not done:
-                            try:
-                                async with client.get(
-                                    f"http://localhost:{PORT}/fetch", params={"url": f"https://{domain}"}
-                                ) as resp:
-                                    if resp.status == 429:
-                                        await asyncio.sleep(0.2)
-                                        continue
-                                    done = True
-                                    try:
-                                        result = await resp.json()
-                                        await publish(
-                                            {"meta": {"domain": domain, "length": len(result)}, "data": result}
-                                        )
-                                        print(f"Finished processing domain {domain}", file=sys.stderr)
-                                    except json.JSONDecodeError as e:
-                                        print(f"JSONDecodeError for domain {domain}: {e}", file=sys.stderr)
-                                        await publish({"meta": {"domain": domain, "error": str(e)}, "data": None})
-                            except (aiohttp.ClientError, ConnectionRefusedError) as e:
-                                print(f"Bundlefetcher {j}: Caught exception {e}", file=sys.stderr)
-                                await asyncio.sleep(2)
+                    done = False
+                    while not done:
+                        try:
+                            async with client.get(
+                                f"http://localhost:{PORT}/fetch", params={"url": f"https://{domain}"}
+                            ) as resp:
+                                if resp.status == 429:
+                                    await asyncio.sleep(0.2)
+                                    continue
                                 done = True
-                                restart = True
-                                await message.reject(requeue=True)
+                                try:
+                                    result = orjson.loads(await resp.read())
+                                    await publish(
+                                        {"meta": {"domain": domain, "length": len(result)}, "data": result}
+                                    )
+                                    print(f"Finished processing domain {domain}", file=sys.stderr)
+                                except orjson.JSONDecodeError as e:
+                                    print(f"JSONDecodeError for domain {domain}: {e}", file=sys.stderr)
+                                    await publish({"meta": {"domain": domain, "error": str(e)}, "data": None})
+                        except (aiohttp.ClientError, ConnectionRefusedError) as e:
+                            # Transient backend hiccup: back off and requeue without
+                            # tearing down the connection pool
+                            print(f"Bundlefetcher {j}: Caught exception {e}", file=sys.stderr)
+                            await asyncio.sleep(2)
+                            done = True
+                            await message.reject(requeue=True)
 
     except KeyboardInterrupt:
         raise
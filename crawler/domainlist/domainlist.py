@@ -1,11 +1,11 @@
 import asyncio
-import csv
 import datetime
 import os
 import random
 import sys
 
 import pipeline
+import pyarrow.csv
 
 QUEUE_NAME = os.getenv("QUEUE_NAME")
 DAILY = bool(int(os.getenv("DAILY", "0")))
@@ -15,11 +15,13 @@ async def domainlist():
     print("Starting domainlist...", file=sys.stderr)
 
     while True:
-        domains = []
-        with open("domainlist.csv", "r") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                domains.append(row[1])
+        # Arrow's multithreaded CSV reader beats a csv.reader loop by an
+        # order of magnitude on million-row lists
+        table = pyarrow.csv.read_csv(
+            "domainlist.csv",
+            read_options=pyarrow.csv.ReadOptions(autogenerate_column_names=True, use_threads=True),
+        )
+        domains = table.column(1).to_pylist()
 
         random.shuffle(domains)
         i = 0
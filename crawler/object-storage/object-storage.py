@@ -1,13 +1,34 @@
 import asyncio
-import lzma
+import collections
+import concurrent.futures
 import os
 import sys
+import weakref
+
+import zstandard
 
 import pipeline
 
 QUEUE_NAME = os.getenv("QUEUE_NAME")
 STORE = os.getenv("STORE", "/store")
 
+# Recently seen keys short-circuit the exists() syscall; per-key locks keep
+# two concurrent messages carrying the same body from compressing it twice
+SEEN_MAX = 1_000_000
+SEEN = collections.OrderedDict()
+KEYLOCKS = weakref.WeakValueDictionary()
+
+# Near-LZMA ratio on JS bundles at a fraction of the CPU time
+cctx = zstandard.ZstdCompressor(level=10, write_content_size=True)
+
+# Compression runs in worker processes, so pending writes use all cores
+# while the event loop stays free for broker I/O
+POOL = None
+
+
+def _compress(obj):
+    return cctx.compress(obj)
+
 hits = 0
 misses = 0
 
@@ -15,18 +36,29 @@ misses = 0
 async def object_storage(msg):
     global hits, misses
 
+    loop = asyncio.get_running_loop()
     for key, obj in msg:
-        if not os.path.exists(f"{STORE}/{key}"):
-            # No async functions available :(
-            misses += 1
-            if isinstance(obj, str):
-                obj = obj.encode()
-            compressed = lzma.compress(obj)
-            await asyncio.sleep(0)  # At least one breakpoint if the data gets really large
-            with open(f"{STORE}/{key}", "wb") as f:
-                f.write(compressed)
-        else:
+        if key in SEEN:
+            SEEN.move_to_end(key)
             hits += 1
+        else:
+            lock = KEYLOCKS.get(key)
+            if lock is None:
+                lock = KEYLOCKS.setdefault(key, asyncio.Lock())
+            async with lock:
+                if key in SEEN or os.path.exists(f"{STORE}/{key}"):
+                    hits += 1
+                else:
+                    misses += 1
+                    if isinstance(obj, str):
+                        obj = obj.encode()
+                    # Offload, so the event loop keeps pumping messages during large compressions
+                    compressed = await loop.run_in_executor(POOL, _compress, obj)
+                    with open(f"{STORE}/{key}", "wb") as f:
+                        f.write(compressed)
+                SEEN[key] = True
+                if len(SEEN) > SEEN_MAX:
+                    SEEN.popitem(last=False)
 
         # Pseudo-random print stats for 1/16th of objects
         if key[0] == "0":
@@ -38,10 +70,15 @@ if __name__ == "__main__":
         print("Missing environment variable 'AMQP_URI'", file=sys.stderr)
         exit(1)
 
+    POOL = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+
     pipeline.run(
         pipeline.consumer(
             os.environ["AMQP_URI"],
             QUEUE_NAME,
             object_storage,
+            # Jobs are short; keep enough buffered locally that the executor
+            # round trips never leave the consumer idle
+            prefetch_count=200,
         ),
     )
@@ -1,4 +1,4 @@
-import hashlib
+import asyncio
 import os
 import pprint
 import sys
@@ -8,17 +8,19 @@ from urllib.parse import quote_plus
 
 import pipeline
 import pymongo
+from blake3 import blake3
 
 store = None
 
 QUEUE_NAME_IN = os.getenv("QUEUE_NAME_IN")
 QUEUE_NAME_OUT = os.getenv("QUEUE_NAME_OUT")
 
-def sha1(data):
+def content_hash(data):
+    # Content-addressed store key, not a security boundary.
+    # 20-byte digest keeps the 40-hex filenames of the old sha1 keys.
     if isinstance(data, str):
-        return hashlib.sha1(data.encode(), usedforsecurity=False).hexdigest()
-    else:
-        return hashlib.sha1(data, usedforsecurity=False).hexdigest()
+        data = data.encode()
+    return blake3(data, max_threads=blake3.AUTO).hexdigest(length=20)
 
 
 async def separating_collector(msg):
@@ -26,38 +28,45 @@ async def separating_collector(msg):
     meta = []
 
     if isinstance(msg["data"], list):
+        js_entries = [e for e in msg["data"] if e["type"] == "js"]
+        redirect_entries = [e for e in msg["data"] if e["type"] == "redirect"]
         for entry in msg["data"]:
-            if entry["type"] == "redirect":
-                meta.append({
-                    "type": "redirect",
-                    "url": entry["url"],
-                    "status": entry["status"],
-                    "location": entry["location"],
-                })
-
-            elif entry["type"] == "js":
-                obj = entry["body"]
-                key = sha1(obj)
-                objects.append((key, obj))
-
-                key2 = None
-                if "sourceMapData" in entry:
-                    obj2 = entry["sourceMapData"]
-                    key2 = sha1(obj2)
-                    objects.append((key2, obj2))
-
-                meta.append({
-                    "type": "js",
-                    "url": entry["url"],
-                    "status": entry["status"],
-                    "source": key,
-                    "sourceMapUrl": entry.get("sourceMapUrl", None),
-                    "sourceMap": key2,
-                })
-
-            else:
+            if entry["type"] not in ("js", "redirect"):
                 print(f"ERROR: unexpected type {entry['type']}", file=sys.stderr)
 
+        meta.extend({
+            "type": "redirect",
+            "url": entry["url"],
+            "status": entry["status"],
+            "location": entry["location"],
+        } for entry in redirect_entries)
+
+        # Hash all bodies of a domain concurrently; blake3 releases the GIL,
+        # so the thread pool spreads the work across cores
+        loop = asyncio.get_running_loop()
+        keys = await asyncio.gather(*[loop.run_in_executor(None, content_hash, e["body"]) for e in js_entries])
+        map_entries = [e for e in js_entries if "sourceMapData" in e]
+        map_keys = iter(
+            await asyncio.gather(*[loop.run_in_executor(None, content_hash, e["sourceMapData"]) for e in map_entries])
+        )
+
+        for entry, key in zip(js_entries, keys):
+            objects.append((key, entry["body"]))
+
+            key2 = None
+            if "sourceMapData" in entry:
+                key2 = next(map_keys)
+                objects.append((key2, entry["sourceMapData"]))
+
+            meta.append({
+                "type": "js",
+                "url": entry["url"],
+                "status": entry["status"],
+                "source": key,
+                "sourceMapUrl": entry.get("sourceMapUrl", None),
+                "sourceMap": key2,
+            })
+
     result = {
         "domain": msg["meta"]["domain"],
         "time": datetime.now(),
@@ -65,7 +74,7 @@ async def separating_collector(msg):
     }
 
     try:
-        store(result)
+        await store(result)
     except Exception as e:
         print(f"ERROR: {e}", file=sys.stderr)
         pass
@@ -89,23 +98,69 @@ if __name__ == "__main__":
     if db_user and db_pass:
         userpass = f"{quote_plus(db_user)}:{quote_plus(db_pass)}@"
 
+    BUF_MAX = 200
+    FLUSH_INTERVAL = 1.0
+
     if db_host:
         db_client = pymongo.MongoClient(f"mongodb://{userpass}{db_host}")
         db = getattr(db_client, db_name)
 
-        def get_collection():
-            return getattr(db, time.strftime("results-%Y%m%d"))
+        _buf = []
+        _last_flush = time.monotonic()
+        _coll_day = None
+        _coll = None
 
-        store = lambda doc: get_collection().insert_one(doc)
+        def get_collection():
+            # Re-resolve the collection handle only when the day rolls over
+            global _coll_day, _coll
+            day = time.strftime("results-%Y%m%d")
+            if day != _coll_day:
+                _coll_day, _coll = day, getattr(db, day)
+            return _coll
+
+        async def flush_buffer():
+            global _last_flush
+            if not _buf:
+                return
+            docs, _buf[:] = list(_buf), []
+            _last_flush = time.monotonic()
+            coll = get_collection()
+            # insert_many is blocking, keep it off the event loop
+            await asyncio.get_running_loop().run_in_executor(None, lambda: coll.insert_many(docs, ordered=False))
+
+        async def store(doc):
+            _buf.append(doc)
+            if len(_buf) >= BUF_MAX or time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+                await flush_buffer()
 
     else:
-        store = lambda doc: pprint.pprint(doc)
-
-    pipeline.run(
-        pipeline.publisher_consumer(
-            os.environ["AMQP_URI"],
-            (QUEUE_NAME_IN, QUEUE_NAME_OUT),
-            separating_collector,
-            prefetch_count=1000,
-        ),
-    )
+        async def store(doc):
+            pprint.pprint(doc)
+
+        async def flush_buffer():
+            pass
+
+    async def run_collector():
+        # store() only checks the flush deadline when another document
+        # arrives; once the queue idles, buffered documents would sit in
+        # _buf although their messages are already acked. Flush on a timer
+        # and once more before the pipeline unwinds, so every acked
+        # document reaches Mongo
+        async def periodic_flush():
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                await flush_buffer()
+
+        flusher = asyncio.create_task(periodic_flush())
+        try:
+            await pipeline.publisher_consumer(
+                os.environ["AMQP_URI"],
+                (QUEUE_NAME_IN, QUEUE_NAME_OUT),
+                separating_collector,
+                prefetch_count=1000,
+            )
+        finally:
+            flusher.cancel()
+            await flush_buffer()
+
+    pipeline.run(run_collector())
@@ -1,7 +1,6 @@
 import asyncio
 import os
 import sys
-import time
 
 import pipeline
 
@@ -10,36 +9,49 @@ QUEUE_NAME_OUT = os.getenv("QUEUE_NAME_OUT")
 MAX_PER_SECOND = int(os.getenv("MAX_PER_SECOND", "10"))
 QUEUE_LENGTH_OUT = int(os.getenv("QUEUE_LENGTH_OUT", str(2 * MAX_PER_SECOND)))
 
-global_time = time.time()
-global_count = 0
+# Token bucket: the refill task tops the bucket up once per second, messages
+# take one token each. Bounded, so idle seconds cannot accumulate a burst
+# beyond MAX_PER_SECOND.
+tokens = None
 
 
-async def throttle(msg):
-    global global_time, global_count
-
-    current_time = time.time()
-    if current_time - global_time > 1:
-        global_time = current_time
-        global_count = 0
+async def refill_tokens():
+    while True:
+        await asyncio.sleep(1.0)
+        for _ in range(MAX_PER_SECOND):
+            try:
+                tokens.release()
+            except ValueError:
+                # Bucket is full
+                break
 
-    global_count += 1
-    if global_count > MAX_PER_SECOND:
-        await asyncio.sleep(1 - (current_time - global_time))
 
+async def throttle(msg):
+    await tokens.acquire()
     return msg
 
 
-if __name__ == "__main__":
-    if "AMQP_URI" not in os.environ:
-        print("Missing environment variable 'AMQP_URI'", file=sys.stderr)
-        exit(1)
+async def main():
+    global tokens
+
+    tokens = asyncio.BoundedSemaphore(MAX_PER_SECOND)
+    refill = asyncio.create_task(refill_tokens())
 
-    pipeline.run(
-        pipeline.publisher_consumer(
+    try:
+        await pipeline.publisher_consumer(
             os.environ["AMQP_URI"],
             (QUEUE_NAME_IN, QUEUE_NAME_OUT),
             throttle,
             prefetch_count=1000,
             max_length=(10000, QUEUE_LENGTH_OUT if QUEUE_LENGTH_OUT > 0 else None),
-        ),
-    )
+        )
+    finally:
+        refill.cancel()
+
+
+if __name__ == "__main__":
+    if "AMQP_URI" not in os.environ:
+        print("Missing environment variable 'AMQP_URI'", file=sys.stderr)
+        exit(1)
+
+    pipeline.run(main())
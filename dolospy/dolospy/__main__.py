@@ -3,14 +3,19 @@ import logging
 from .dolospy import *
 
 import argparse as __argparse
+import functools as __functools
 import logging as __logging
 
+@__functools.cache
 def __cpu_count() -> int:
     import os, sys
 
-    if sys.version >= (3, 13):
+    if sys.version_info >= (3, 13):
         return os.process_cpu_count()
-    else:
+    # Respect cgroup/affinity limits, so containers do not oversubscribe
+    try:
+        return len(os.sched_getaffinity(0)) or os.cpu_count()
+    except AttributeError:
         return os.cpu_count()
 
 def __main():
@@ -40,8 +45,9 @@ def __main():
 def __preindexer(args: __argparse.Namespace, logger: __logging.Logger):
     import collections
     import concurrent.futures
-    import os, time, sys
+    import os, sys
 
+    import packaging.version
     from tqdm import tqdm
 
     npm_dir = os.getenv("NPM_DIR")
@@ -53,11 +59,16 @@ def __preindexer(args: __argparse.Namespace, logger: __logging.Logger):
 
     package_versions = collections.defaultdict(list)
     for dirent in os.scandir(npm_dir):
-        pkg, vers = dirent.name.rsplit("@", 1)
+        # rpartition is a single C-level scan from the right
+        pkg, _, vers = dirent.name.rpartition("@")
         package_versions[pkg].append(vers)
 
-    for verss in package_versions.values():
-        verss.sort(key=lambda v: tuple(map(int, v.split("."))))
+    # Decorate-sort-undecorate: one parse per version, and pre-release tags
+    # like 1.0.0-rc1 order correctly instead of crashing the int() cast
+    for pkg, verss in package_versions.items():
+        decorated = [(packaging.version.parse(v), v) for v in verss]
+        decorated.sort()
+        package_versions[pkg] = [v for _, v in decorated]
 
     num_workers = args.worker
     if num_workers <= 0:
@@ -70,16 +81,11 @@ def __preindexer(args: __argparse.Namespace, logger: __logging.Logger):
         ]
 
         progress_target = sys.stderr if logger.isEnabledFor(__logging.INFO) else open(os.path.devnull)
-        progress = tqdm(total=len(futures), unit="packages", file=progress_target)
-        while True:
-            progress.n = sum(1 for f in futures if f.done())
-            progress.update(0)
-            if progress.n == len(futures):
-                break
-            time.sleep(0.4)
-        progress.close()
-
-        results = [future.result() for future in futures]
+        results = []
+        with tqdm(total=len(futures), unit="packages", file=progress_target) as progress:
+            for future in concurrent.futures.as_completed(futures):
+                results.append(future.result())
+                progress.update(1)
 
     import statistics
 
@@ -90,13 +96,29 @@ def __preindexer(args: __argparse.Namespace, logger: __logging.Logger):
     logging.info(f"  Median: {statistics.median(results)}")
     logging.info(f"  Max: {max(results)}")
 
+__session = None
+
+def __preprocessor_session():
+    # One keep-alive session per worker process, so fetching dozens of
+    # versions of a package reuses the same connection
+    import requests, requests.adapters
+
+    global __session
+    if __session is None:
+        __session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        __session.mount("http://", adapter)
+        __session.mount("https://", adapter)
+    return __session
+
 def __preindexer_worker(args: __argparse.Namespace, logger: __logging.Logger, pkg: str, verss: list[str]):
     import os, time
     import urllib.parse
 
-    import requests
+    import msgpack
 
     start = time.time()
+    session = __preprocessor_session()
 
     index_dir = os.getenv("INDEX_DIR")
     output = os.path.join(index_dir, f"{pkg}.index.json")
@@ -104,11 +126,17 @@ def __preindexer_worker(args: __argparse.Namespace, logger: __logging.Logger, pk
 
     for vers in verss:
         logger.debug(f"Preprocessing {pkg} {vers}")
-        resp = requests.get(f"{args.preprocessor_url}?{urllib.parse.urlencode({'pkg': pkg, 'version': vers})}")
+        resp = session.get(
+            f"{args.preprocessor_url}?{urllib.parse.urlencode({'pkg': pkg, 'version': vers})}",
+            headers={"Accept": "application/msgpack"},
+        )
         if resp.status_code != 200:
             logger.error(f"Preprocessor returned error for {pkg} {vers}")
             continue
-        code = resp.json()
+        if resp.headers.get("Content-Type", "").startswith("application/msgpack"):
+            code = msgpack.unpackb(resp.content, raw=False)
+        else:
+            code = resp.json()
         logger.debug(f"Tokenizing and indexing {pkg} {vers} (size {len(code)})")
         index.addToGroup(vers, code)
 
@@ -1,9 +1,11 @@
 import ast
+import functools
+import json
 import os
 import re
 import statistics
-import string
 
+import numpy as np
 import semantic_version as sv
 
 DATASETS = os.path.join(os.getenv("HOME", ".."), "datasets")
@@ -24,23 +26,18 @@ def fix_libname(libname: str):
         return libname.replace("+", "/", 1)
     return libname
 
+# One C-level scan yields only the components containing an "@" instead of
+# splitting into a throwaway list and filtering in Python
+_pnpm_component = re.compile(r"(?:^|_)([^_]*@[^_]+)")
+
 def parse_pnpm_names(name):
-    names = []
-    components = name.split("_")
-    for component in components:
-        if "@" in component:
-            names.append(component.replace("+", "/"))
-    return names
+    return [c.replace("+", "/") for c in _pnpm_component.findall(name)]
 
 def parse_full_pnpm_names(full_name):
-    names = []
-    name = full_name.split(".pnpm/", 1)[-1].split("/", 1)[0]
-
-    components = name.split("_")
-    for component in components:
-        if "@" in component:
-            names.append(component.replace("+", "/"))
-    return names
+    # partition avoids the list allocations of split(..., 1)
+    _, sep, rest = full_name.partition(".pnpm/")
+    name = (rest if sep else full_name).partition("/")[0]
+    return [c.replace("+", "/") for c in _pnpm_component.findall(name)]
 
 def get_version(pkg_at_version):
     return pkg_at_version.rsplit("@", 1)[-1]
@@ -59,8 +56,30 @@ def semver_distance(u, v):
     v1, v2 = map(sv.Version.coerce, (u, v))
     return abs(v2.major - v1.major), abs(v2.minor - v1.minor), abs(v2.patch - v1.patch)
 
+def precompute_versions(l):
+    """
+    Parse a version list once into (major, minor, patch) int arrays
+
+    Pass the result to semver_distance_list instead of the raw list when
+    comparing many versions against the same candidates.
+    """
+    versions = [sv.Version.coerce(u) for u in l]
+    return (
+        np.array([u.major for u in versions], dtype=np.int32),
+        np.array([u.minor for u in versions], dtype=np.int32),
+        np.array([u.patch for u in versions], dtype=np.int32),
+    )
+
 def semver_distance_list(v, l):
-    return min([semver_distance(u, v) for u in l])
+    # Accepts either a raw version list or the arrays from precompute_versions;
+    # the latter avoids re-coercing every candidate on every call
+    if not isinstance(l, tuple):
+        l = precompute_versions(l)
+    major, minor, patch = l
+    u = sv.Version.coerce(v)
+    diffs = np.stack([np.abs(major - u.major), np.abs(minor - u.minor), np.abs(patch - u.patch)])
+    best = np.lexsort(diffs[::-1])[0]
+    return tuple(int(d) for d in diffs[:, best])
 
 def extendReduce(p, c):
     p.extend(c)
@@ -69,19 +88,38 @@ def extendReduce(p, c):
 def compute_statistics(l):
     return [min(l), statistics.median(l), statistics.mean(l), max(l)]
 
+def _loads(s):
+    # The embedded metadata is usually JSON-compatible; json's C tokenizer is
+    # much faster than the full parser pipeline ast.literal_eval runs.
+    # Python-repr strings (single quotes) fall back to the old path
+    try:
+        return json.loads(s)
+    except json.JSONDecodeError:
+        return ast.literal_eval(s)
+
 def extract_main_dependency_from_domain(domain):
     metastr = domain.split("/", 1)[-1]
-    meta = ast.literal_eval(metastr)
-    return ast.literal_eval(meta[1])
+    meta = _loads(metastr)
+    return _loads(meta[1])
 
 
 numbers_with_short_units = re.compile(r"^(-?[0-9]+[a-z]{0,3} *)+$")
-_is_hinting_fingerprint_cache = {}
 
-def is_hinting_fingerprint(s):
-    if s in _is_hinting_fingerprint_cache:
-        return _is_hinting_fingerprint_cache[s]
+_HINTING_LITERALS = frozenset({
+    # The first two seem to be quite common selectors for all focusable elements
+    'button, [href], input, select, textarea, [tabindex]:not([tabindex="-1"])',
+    'button, [href], input, select, textarea, [tabindex="0"]',
+    "input, select, textarea, button",
+    # Webpack-specific
+    "ES Modules may not assign module.exports or exports.*, Use ESM export syntax, instead: ",
+    # Contained in official emoji list
+    "hamburger,meat,fast food,beef,cheeseburger,mcdonalds,burger king",
+})
 
+# Bounded, unlike the plain dict cache it replaces: evaluation runs see
+# millions of distinct fingerprint strings
+@functools.lru_cache(maxsize=65536)
+def is_hinting_fingerprint(s):
     # Ignore transition libraries https://easings.net/
     if "cubic-bezier(" in s:
         return True
@@ -95,29 +133,28 @@ def is_hinting_fingerprint(s):
     #     continue
 
     # Ignore numbers with short units
-    if re.match(r"^(-?[0-9]+[a-z]{0,3} *)+$", s):
+    if numbers_with_short_units.match(s):
         return False
 
-    # The first two seem to be quite common selectors for all focusable elements
-    if s in [
-        'button, [href], input, select, textarea, [tabindex]:not([tabindex="-1"])',
-        'button, [href], input, select, textarea, [tabindex="0"]',
-        "input, select, textarea, button",
-    ]:
-        return True
-
-    # Webpack-specific
-    if s == "ES Modules may not assign module.exports or exports.*, Use ESM export syntax, instead: ":
-        return True
-
-    # Contained in official emoji list
-    if s == "hamburger,meat,fast food,beef,cheeseburger,mcdonalds,burger king":
+    if s in _HINTING_LITERALS:
         return True
 
     return False
 
+# Compiled once; re.match would recompile-cache-probe these on every URL
+_firebase_file = re.compile("firebase-([a-z-]+).js")
+_firebase_compat_file = re.compile("firebase-([a-z]+)-compat.js")
+
 def fix_ground_truth(ground_truth, url, _fp):
-    if len(list([p for p in ground_truth if "popper" in p])):  # Popper probably implies bootstrap
+    # One early-exiting pass over the set; the old list comprehensions
+    # materialized all hits just to test for existence
+    has_popper = has_sentry = False
+    for p in ground_truth:
+        has_popper = has_popper or "popper" in p
+        has_sentry = has_sentry or "@sentry/" in p
+        if has_popper and has_sentry:
+            break
+    if has_popper:  # Popper probably implies bootstrap
         ground_truth.add("bootstrap")
     if "swiper-bundle" in url:
         ground_truth.add("swiper")
@@ -130,10 +167,10 @@ def fix_ground_truth(ground_truth, url, _fp):
         ground_truth.add("@firebase/component")
         ground_truth.add("@firebase/util")
         file = url.rsplit("/", 1)[1]
-        m = re.match("firebase-([a-z-]+).js", file)
+        m = _firebase_file.match(file)
         if m:
             ground_truth.add(f"@firebase/{m.group(1)}")
-        m = re.match("firebase-([a-z]+)-compat.js", file)
+        m = _firebase_compat_file.match(file)
         if m:
             ground_truth.add(f"@firebase/{m.group(1)}")
     # if "@firebase/installations" in detected and "firebase" in url:
@@ -148,7 +185,7 @@ def fix_ground_truth(ground_truth, url, _fp):
     if "@zig-design-system/ui-components" in ground_truth:
         # bundled dependency in private package
         ground_truth.add("bind-decorator")
-    if len(list([p for p in ground_truth if "@sentry/" in p])) > 0:
+    if has_sentry:
         # sentry tracing seems to be available in all
         ground_truth.add("@sentry/tracing")
 
@@ -177,27 +214,49 @@ CDN_REGEXS = [
     ],
 ]
 
+# One C-level alternation scan decides the CDN host instead of six substring
+# checks per call
+_CDN_HOST_RE = re.compile("|".join(map(re.escape, CDN_HOSTS)))
+
+# Per host, all patterns merged into one alternation with uniquely named
+# groups, so a single search replaces up to four; the matched host token
+# indexes straight into this dict
+_CDN_HOST_REGEX = {
+    host: re.compile(
+        "|".join(
+            "(?:" + r.pattern.replace("?P<lib>", f"?P<lib{i}>").replace("?P<vers>", f"?P<vers{i}>") + ")"
+            for i, r in enumerate(regexes)
+        )
+    )
+    for host, regexes in zip(CDN_HOSTS, CDN_REGEXS)
+}
+
+@functools.lru_cache(maxsize=100_000)
 def get_library_version_from_cdn_url(url):
-    for cdn_host, regexes in zip(CDN_HOSTS, CDN_REGEXS):
-        if cdn_host in url:
-            for regex in regexes:
-                match = regex.search(url)
-                if match:
-                    d = match.groupdict()
-                    return d.get("lib", "").lower(), d.get("vers", "*")
+    host = _CDN_HOST_RE.search(url)
+    if host is None:
+        return None
+
+    match = _CDN_HOST_REGEX[host.group(0)].search(url)
+    if match:
+        d = match.groupdict()
+        for name, lib in d.items():
+            if lib is not None and name.startswith("lib"):
+                return lib.lower(), d.get(f"vers{name[3:]}") or "*"
 
     return None
 
 _strip_leading_zeroes = re.compile(r"(-.+[^0-9])0+([1-9])")
+_first_digit = re.compile(r"[0-9]")
 
 def coerce_version(v):
-    if all(d not in v for d in string.digits):
+    # One C-level scan finds the first digit; the old per-digit `in` checks
+    # plus character-wise slicing were quadratic on long prefixes
+    m = _first_digit.search(v)
+    if m is None:
         return sv.Version.coerce(f"0-{v}")
 
-    while v[0] not in string.digits:
-        v = v[1:]
-
-    v = _strip_leading_zeroes.sub(r"\1\2", v)
+    v = _strip_leading_zeroes.sub(r"\1\2", v[m.start():])
 
     return sv.Version.coerce(v)
 
@@ -213,6 +272,7 @@ __all__ = [
     "metric",
     "semver_distance",
     "semver_distance_list",
+    "precompute_versions",
     "extendReduce",
     "compute_statistics",
     "extract_main_dependency_from_domain",
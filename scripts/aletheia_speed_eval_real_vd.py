@@ -1,10 +1,13 @@
 import argparse
+import concurrent.futures
 import io
 import json
 import lzma
+import mmap
 import multiprocessing
 import multiprocessing.shared_memory
 import os
+import struct
 import subprocess
 import sys
 import tarfile
@@ -12,11 +15,18 @@ import time
 
 import bson
 import requests
+import requests.adapters
+import zstandard
 from tqdm import tqdm
 
+from object_codec import decompress_object
+
 SHM_META_NAME = "aletheia_speed_eval_meta"
 SHM_DATA_NAME = "aletheia_speed_eval"
 WORKER = multiprocessing.cpu_count()
+# Job indices claimed per lock acquisition; short jobs otherwise serialize
+# on the shared counter's mutex
+CLAIM_BATCH = 64
 ENDPOINT = "/identify/without_truths/compartments"
 
 class DocumentV2:
@@ -58,38 +68,57 @@ class DocumentV2:
         return data_element["type"]
 
 
-def build_job_list_from_single_file(file) -> set:
-    jobs = set()
+def build_job_list_from_single_file(file) -> list[bytes]:
+    # Sharded by the leading hex nibble of the source hash: stable across
+    # processes, unlike randomized str hashing
+    shards = [set() for _ in range(16)]
 
+    # Decode in place from the page cache instead of copying the file through
+    # Python buffered IO
     with open(file, "rb") as f:
-        for _doc in bson.decode_file_iter(f):
+        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        for _doc in bson.decode_iter(memoryview(mm)):
             assert "time" in _doc, f"Unsupported V1 document found in {file}"
-            doc = DocumentV2(_doc)
 
-            if not doc.has_error:
-                for resp in doc.data:
-                    if doc.get_type(resp) == "js":
-                        source = resp.get("source")
-                        sourcemap = resp.get("sourceMap")
+            # Plain dict access: the DocumentV2 wrapper costs an allocation and
+            # several property calls per document in this hot loop
+            meta = _doc.get("meta")
+            if not isinstance(meta, list):
+                continue
+            for resp in meta:
+                if resp.get("type") != "js":
+                    continue
+
+                source = resp.get("source")
+                sourcemap = resp.get("sourceMap")
 
-                        if sourcemap is None:
-                            continue
+                if sourcemap is None:
+                    continue
 
-                        assert type(source) is str, f"Source has unexpected type {type(source)}"
-                        resp_hash = f"{source}:{sourcemap}"
-                        jobs.add(resp_hash)
+                assert type(source) is str, f"Source has unexpected type {type(source)}"
+                job = source + ":" + sourcemap
+                shards[int(job[0], 16)].add(job)
 
-    return jobs
+    # One NUL-joined blob per shard pickles as a plain buffer on the pipe
+    # back to the parent; a set of ~1M short strings costs one pickle op
+    # per element
+    return ["\x00".join(shard).encode("ascii") for shard in shards]
 
 
 def build_job_list(files) -> set:
-    jobs = set()
+    # Merge shard-wise: every master shard stays small while it grows, and
+    # the full-size set is built exactly once at the end instead of being
+    # rehashed incrementally across all per-file updates
+    final_shards = [set() for _ in range(16)]
 
     with multiprocessing.Pool(WORKER) as pool:
-        for jobset in pool.imap_unordered(build_job_list_from_single_file, files):
-            jobs.update(jobset)
+        for blobs in pool.imap_unordered(build_job_list_from_single_file, files):
+            for shard, blob in zip(final_shards, blobs):
+                if blob:
+                    shard.update(blob.decode("ascii").split("\x00"))
 
-    return jobs
+    return set().union(*final_shards)
 
 
 def worker(
@@ -108,6 +137,21 @@ def worker(
 
     server = None
 
+    # Results are buffered per worker and appended in batches: opening the
+    # output file under the shared lock for every single result cost two
+    # syscalls plus lock contention per job
+    out_buf = bytearray()
+    last_flush = time.monotonic()
+
+    def flush_results():
+        nonlocal last_flush
+        if out_buf:
+            with output_lock:
+                with open(output_file, "ab") as f:
+                    f.write(out_buf)
+            out_buf.clear()
+        last_flush = time.monotonic()
+
     try:
         server = subprocess.Popen(["node", "identification/identify.mjs"], env=env)
         time.sleep(1)
@@ -121,75 +165,95 @@ def worker(
                 time.sleep(0.5)
         print(f"Worker {worker_id}: Server started", file=sys.stderr)
 
-        # noinspection PyTypeChecker
-        jobs = [j.decode("ascii") for j in bytes(shm_meta.buf).split(b"\x00", total_jobs)][:total_jobs]
+        # Keep-alive session: reuse one TCP connection to the local server
+        # instead of socket() + connect() + close() per job
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        identify_url = f"http://localhost:{PORT}{ENDPOINT}"
+
+        # O(1) job lookup through the offset table; only the claimed job is
+        # ever copied out of shared memory
+        meta_mv = memoryview(shm_meta.buf)
+        (job_count,) = struct.unpack_from("<I", meta_mv, 0)
+        assert job_count == total_jobs, f"Metadata header disagrees: {job_count=} != {total_jobs=}"
+        job_offsets = meta_mv[4:4 + 4 * (total_jobs + 1)].cast("I")
+        # Slices of a memoryview are zero-copy; the decoder reads straight
+        # out of the shared-memory pages
+        data_mv = memoryview(shm_data.buf)
         while True:
             with next_job.get_lock():
-                job_index = next_job.value
-                if job_index >= total_jobs:
+                start = next_job.value
+                if start >= total_jobs:
                     print(f"Worker {worker_id}: Finished", file=sys.stderr)
                     break
-                next_job.value += 1
+                end = min(start + CLAIM_BATCH, total_jobs)
+                next_job.value = end
 
-            # Work on job
-            job = jobs[job_index]
-            source_hash, sourcemap_hash = job.split(":")
+            for job_index in range(start, end):
+                # Work on job
+                job = bytes(meta_mv[job_offsets[job_index]:job_offsets[job_index + 1]]).decode("ascii")
+                source_hash, sourcemap_hash = job.split(":")
 
-            assert source_hash in index, f"source_hash not in object storage"
-            assert sourcemap_hash in index, f"source_hash not in object storage"
-
-            try:
-                offset, size = index[source_hash]
-                # noinspection PyTypeChecker
-                source = lzma.decompress(shm_data.buf[offset:offset + size]).decode()
-
-                offset, size = index[sourcemap_hash]
-                # noinspection PyTypeChecker
-                sourcemap = lzma.decompress(shm_data.buf[offset:offset + size]).decode()
-
-                # Make sure it is a pnpm sourcemap
-                try:
-                    decoded_map = json.loads(sourcemap)
-                    sources = decoded_map["sources"]
-                    assert len([source for source in sources if "/.pnpm/" in source])
-                except (json.JSONDecodeError, KeyError, TypeError, AssertionError):
-                    result = {
-                        "id": job,
-                        "ignore": True,
-                    }
-                    with output_lock:
-                        with open(output_file, "ab") as f:
-                            f.write(bson.encode(result))
-                    continue
+                assert source_hash in index, f"source_hash not in object storage"
+                assert sourcemap_hash in index, f"source_hash not in object storage"
 
                 try:
-                    resp = requests.post(f"http://localhost:{PORT}{ENDPOINT}", json={"source": source, "map": sourcemap})
-                    if resp.status_code >= 300:
-                        if resp.status_code == 501:
-                            # Tried to parse JSON => ignore
-                            pass
-                        else:
-                            print(f"Worker {worker_id}: Error for {job}", file=sys.stderr)
-
+                    offset, size = index[source_hash]
+                    source = decompress_object(data_mv[offset:offset + size]).decode()
+
+                    offset, size = index[sourcemap_hash]
+                    raw_map = decompress_object(data_mv[offset:offset + size])
+
+                    # Make sure it is a pnpm sourcemap. The substring scan over
+                    # the raw bytes short-circuits the parse: most maps contain
+                    # no pnpm path at all, and the C-level scan is far cheaper
+                    # than decoding multi-MB JSON
+                    try:
+                        assert b"/.pnpm/" in raw_map
+                        decoded_map = json.loads(raw_map)
+                        sources = decoded_map["sources"]
+                        assert len([source for source in sources if "/.pnpm/" in source])
+                    except (json.JSONDecodeError, KeyError, TypeError, AssertionError):
                         result = {
                             "id": job,
-                            "error": resp.text
+                            "ignore": True,
                         }
-                    else:
-                        result = resp.json()
-                        result["id"] = job
-
-                    # Store output
-                    with output_lock:
-                        with open(output_file, "ab") as f:
-                            f.write(bson.encode(result))
-                except (requests.RequestException,):
-                    pass
+                        out_buf += bson.encode(result)
+                        if len(out_buf) > (1 << 20) or time.monotonic() - last_flush > 1:
+                            flush_results()
+                        continue
+
+                    sourcemap = raw_map.decode()
+
+                    try:
+                        resp = session.post(identify_url, json={"source": source, "map": sourcemap})
+                        if resp.status_code >= 300:
+                            if resp.status_code == 501:
+                                # Tried to parse JSON => ignore
+                                pass
+                            else:
+                                print(f"Worker {worker_id}: Error for {job}", file=sys.stderr)
+
+                            result = {
+                                "id": job,
+                                "error": resp.text
+                            }
+                        else:
+                            result = resp.json()
+                            result["id"] = job
+
+                        # Store output
+                        out_buf += bson.encode(result)
+                        if len(out_buf) > (1 << 20) or time.monotonic() - last_flush > 1:
+                            flush_results()
+                    except (requests.RequestException,):
+                        pass
 
-            except (lzma.LZMAError, UnicodeDecodeError) as e:
-                print(f"Worker {worker_id}: Unexpected {type(e)} for {job}", file=sys.stderr)
+                except (lzma.LZMAError, zstandard.ZstdError, UnicodeDecodeError) as e:
+                    print(f"Worker {worker_id}: Unexpected {type(e)} for {job}", file=sys.stderr)
 
     finally:
+        flush_results()
         try:
             server.terminate()
             server.wait(1)
@@ -250,10 +314,26 @@ def main():
         shm_data = multiprocessing.shared_memory.SharedMemory(create=True, size=FILESIZE, name=SHM_DATA_NAME)
 
         print(f"Reading {args.object_storage=} into RAM (this may take a while) ... ")
-        bs = 1024 * 1024
-        with open(args.object_storage, mode="rb") as f:
-            for offset in tqdm(range(0, FILESIZE, bs), unit="MByte", miniters=1500):
-                shm_data.buf[offset : offset + bs] = f.read(bs)
+        bs = 64 * 1024 * 1024
+        mv = memoryview(shm_data.buf)
+        fd = os.open(args.object_storage, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, FILESIZE, os.POSIX_FADV_SEQUENTIAL)
+
+            def read_chunk(offset):
+                # pread releases the GIL, so the chunk reads overlap in the pool
+                length = min(bs, FILESIZE - offset)
+                mv[offset : offset + length] = os.pread(fd, length, offset)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+                for _ in tqdm(
+                    pool.map(read_chunk, range(0, FILESIZE, bs)), total=-(-FILESIZE // bs), unit="chunks"
+                ):
+                    pass
+        finally:
+            # Exported views keep shm_data.close() from succeeding later
+            mv.release()
+            os.close(fd)
 
         print(f"Building tar index (this may take a while) ... ")
         index = {}
@@ -280,14 +360,25 @@ def main():
         # Step 1: Create multiprocessing data
         next_job = multiprocessing.Value("i", 0)
         output_lock = multiprocessing.Lock()
-        shm_len = sum(len(job)+1 for job in jobs)
+
+        # Layout: count || uint32 offsets[N+1] || concatenated ascii payload.
+        # Workers index jobs in O(1) through the offset table instead of
+        # splitting a copy of the whole region on NUL bytes at startup.
+        jobs = list(jobs)
+        header_len = 4 + 4 * (len(jobs) + 1)
+        shm_len = header_len + sum(len(job) for job in jobs)
 
         shm_meta = multiprocessing.shared_memory.SharedMemory(create=True, size=shm_len, name=SHM_META_NAME)
         print(f"Allocated {shm_len >> 10} KiB of shared memory for metadata")
-        offset = 0
-        for job in jobs:
-            shm_meta.buf[offset:offset + len(job) + 1] = job.encode("ascii") + b"\x00"
-            offset += len(job) + 1
+        shm_meta.buf[0:4] = struct.pack("<I", len(jobs))
+        offsets = shm_meta.buf[4:header_len].cast("I")
+        offset = header_len
+        for job_index, job in enumerate(jobs):
+            offsets[job_index] = offset
+            shm_meta.buf[offset:offset + len(job)] = job.encode("ascii")
+            offset += len(job)
+        offsets[len(jobs)] = offset
+        offsets.release()
 
         # Step 4: Create worker
         processes = []
@@ -307,6 +398,8 @@ def main():
         print("Collecting processes ...")
         for process in processes:
             process.join()
+            if process.exitcode:
+                print(f"Worker exited with code {process.exitcode}", file=sys.stderr)
 
     finally:
         if shm_data:
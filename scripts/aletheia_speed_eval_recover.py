@@ -1,5 +1,6 @@
 import argparse
 import json
+import mmap
 import multiprocessing
 import multiprocessing.shared_memory
 import os
@@ -59,8 +60,12 @@ class DocumentV2:
 def build_job_list_from_single_file(file) -> set:
     jobs = set()
 
+    # Decode in place from the page cache instead of copying the file through
+    # Python buffered IO
     with open(file, "rb") as f:
-        for _doc in bson.decode_file_iter(f):
+        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        for _doc in bson.decode_iter(memoryview(mm)):
             assert "time" in _doc, f"Unsupported V1 document found in {file}"
             doc = DocumentV2(_doc)
 
@@ -148,7 +153,9 @@ def main():
     # Step 2: Read results
     print("Reading results", flush=True)
     with open(args.results, "rb") as f:
-        results = {r["id"]: r for r in bson.decode_all(f.read())}
+        mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        results = {r["id"]: r for r in bson.decode_iter(memoryview(mm))}
 
     # Step 3: Recovering
     print("Recovering results", flush=True)
@@ -1,22 +1,28 @@
 import argparse
 import concurrent.futures
-import gzip
-import hashlib
+import functools
 import itertools
 import json
 import lzma
+import mmap
 import multiprocessing
-import multiprocessing.shared_memory
 import os
+import re
+import struct
 import subprocess
 import sys
 import time
 
 import bson
+from blake3 import blake3
+import orjson
 import requests
+import requests.adapters
+import zstandard
 from tqdm import tqdm
 
-SHM_NAME = "bundle-dataset-analyzer"
+from object_codec import decompress_object
+
 FILESIZE = 0
 
 TOTAL = 1000000
@@ -31,17 +37,31 @@ REQUEST_CACHE = os.getenv("HOME") + "/data/request-cache"
 HEADERS = None
 
 
+# Process-wide: the per-Document read caches died with every Document, so a
+# blob shared by many documents was re-read and re-inflated each time
+@functools.lru_cache(maxsize=4096)
+def _load_object(path):
+    try:
+        with open(path, "rb") as f:
+            return decompress_object(f.read())
+    except (OSError, lzma.LZMAError, zstandard.ZstdError):
+        return None
+
+
 class Document:
     """
     Format used in daily scans.
     More polished and objects de-duplicated in object-storage.
     Source Maps always grouped.
     """
+    # A pure view over the decoded dict; slots keep the one-per-document
+    # instances to a single pointer instead of a dict
+    __slots__ = ("_doc",)
+
+    version = 2
+
     def __init__(self, doc):
-        self.version = 2
         self._doc = doc
-        self._data = None
-        self._read_cache = {}
 
     @property
     def domain(self):
@@ -73,15 +93,17 @@ class Document:
         if prop not in data_element or data_element[prop] is None:
             return None
 
-        if f"{STORE}/{data_element[prop]}" in self._read_cache:
-            return self._read_cache[f"{STORE}/{data_element[prop]}"]
+        return _load_object(f"{STORE}/{data_element[prop]}")
 
+    def has_source_map(self, data_element):
+        # Cheap presence probe: a stat answers "is there anything to parse?"
+        # without inflating the blob
+        if data_element.get("sourceMap") is None:
+            return False
         try:
-            with open(f"{STORE}/{data_element[prop]}", "rb") as f:
-                self._read_cache[f"{STORE}/{data_element[prop]}"] = lzma.decompress(f.read())
-                return self._read_cache[f"{STORE}/{data_element[prop]}"]
-        except (OSError, lzma.LZMAError):
-            return None
+            return os.stat(f"{STORE}/{data_element['sourceMap']}").st_size > 0
+        except OSError:
+            return False
 
     def get_source(self, data_element):
         return self._get_file_prop(data_element, "source")
@@ -93,189 +115,288 @@ class Document:
 CommonErrors = (json.JSONDecodeError, lzma.LZMAError, KeyError, AttributeError)
 
 
+@functools.lru_cache(maxsize=None)
+def _request_cache_dir(a, b):
+    # One makedirs per prefix pair; millions of flat siblings make every
+    # exists()/open() pay for a huge directory-entry lookup
+    path = f"{REQUEST_CACHE}/{a}/{b}"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _request_cache_path(request_hash):
+    return f"{_request_cache_dir(request_hash[:2], request_hash[2:4])}/{request_hash[4:]}"
+
+
+def _open_dataset():
+    # Read-only mapping of the dataset file; the page cache backs every
+    # worker's view, so nothing is copied up front
+    fd = os.open(globals()["dataset_path"], os.O_RDONLY)
+    try:
+        mm = mmap.mmap(fd, 0, prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+    mm.madvise(mmap.MADV_WILLNEED)
+    return mm
+
+
+def _worker_slice(mm, start_index):
+    # Byte range of this worker's documents, taken from the offset index main()
+    # builds with one linear scan over the length prefixes. Decoding starts at
+    # the first assigned document instead of re-parsing the whole dataset from
+    # offset zero in all WORKER processes. Callers feed the slice to
+    # bson.decode_all, which turns it into dicts in a single C call instead
+    # of driving a Python-level generator document by document
+    offsets = globals()["doc_offsets"]
+    last = len(offsets) - 1
+    start = offsets[min(start_index, last)]
+    stop = offsets[min(start_index + STEPSIZE, last)]
+    return memoryview(mm)[start:stop]
+
+
+# A source map's "mappings" VLQ blob is typically 80-95% of the payload; when
+# only "sources" is needed, cut that array out with a bounded scan and parse
+# just it. A "]" inside a path leaves an unparseable fragment, so the full
+# parse below keeps the slow path correct
+_SOURCES_STR_RE = re.compile(r'"sources"\s*:\s*(\[[^\]]*\])')
+_SOURCES_BYTES_RE = re.compile(rb'"sources"\s*:\s*(\[[^\]]*\])')
+
+
+def _source_map_sources(raw):
+    pattern = _SOURCES_BYTES_RE if isinstance(raw, bytes) else _SOURCES_STR_RE
+    if (m := pattern.search(raw, 0, 65536)) is not None:
+        try:
+            return orjson.loads(m.group(1))
+        except orjson.JSONDecodeError:
+            pass
+    source_map = orjson.loads(raw)
+    if isinstance(source_map, dict) and isinstance(source_map.get("sources"), list):
+        return source_map["sources"]
+    return None
+
+
 def get_urls(start_index, worker_id=None):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     urls = []
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            batch = []
-            doc = Document(_doc)
-            try:
-                if not doc.has_error:
-                    for obj in doc.data:
-                        if "url" in obj:
-                            batch.append(obj["url"])
-                    if BATCH_PER_DOMAIN:
-                        urls.append({"domain": doc.domain, "urls": batch})
-                    else:
-                        urls.extend(batch)
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        batch = []
+        doc = Document(_doc)
+        try:
+            if not doc.has_error:
+                for obj in doc.data:
+                    if "url" in obj:
+                        batch.append(obj["url"])
+                if BATCH_PER_DOMAIN:
+                    urls.append({"domain": doc.domain, "urls": batch})
+                else:
+                    urls.extend(batch)
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return urls
 
 
 def count_responsive_sites(start_index, worker_id=None):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     results = []
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            doc = Document(_doc)
-            try:
-                if not doc.has_error:
-                    if len([o for o in doc.data if doc.get_type(o) == "js"]) > 0:
-                        results.append(True)
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        doc = Document(_doc)
+        try:
+            if not doc.has_error:
+                if len([o for o in doc.data if doc.get_type(o) == "js"]) > 0:
+                    results.append(True)
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return len(results)
 
 
 def extract_domain_artifacts(start_index, worker_id=None, searched_domain=None):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     content = []
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            doc = Document(_doc)
-            try:
-                if doc.domain == searched_domain:
-                    content.append(
-                        {
-                            "meta": doc.meta,
-                            "data": doc.data,
-                        }
-                    )
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        doc = Document(_doc)
+        try:
+            if doc.domain == searched_domain:
+                content.append(
+                    {
+                        "meta": doc.meta,
+                        "data": doc.data,
+                    }
+                )
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return content
 
 
 def get_source_map_sources(start_index, worker_id=None):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     sources = []
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            batch = []
-            doc = Document(_doc)
-            try:
-                if not doc.has_error:
-                    for obj in doc.data:
-                        try:
-                            if doc.get_source_map(obj) is not None and len(doc.get_source_map(obj)) > 0:
-                                source_map = json.loads(doc.get_source_map(obj))
-                                batch.extend(source_map["sources"])
-                            elif doc.version == 1 and doc.is_source_map(obj):
-                                source_map = json.loads(obj["body"])
-                                batch.extend(source_map["sources"])
-                        except CommonErrors as e:
-                            if len(doc.get_source_map(obj)) == 0:
-                                print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
-                            else:
-                                print(
-                                    f"Error for {doc.domain=} {obj['url']=} {len(doc.get_source_map(obj))[:32]=}: {type(e)} {e}",
-                                    file=sys.stderr,
-                                )
-                    getattr(sources, "append" if BATCH_PER_DOMAIN else "extend")(batch)
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        batch = []
+        doc = Document(_doc)
+        try:
+            if not doc.has_error:
+                for obj in doc.data:
+                    # Fetched once; the error branches below reuse it instead
+                    # of re-reading the blob per format expression
+                    sm = None
+                    try:
+                        if doc.has_source_map(obj) and (sm := doc.get_source_map(obj)) is not None:
+                            batch.extend(_source_map_sources(sm) or [])
+                        elif doc.version == 1 and doc.is_source_map(obj):
+                            batch.extend(_source_map_sources(obj["body"]) or [])
+                    except CommonErrors as e:
+                        if not sm:
+                            print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
+                        else:
+                            print(
+                                f"Error for {doc.domain=} {obj['url']=} {sm[:32]=}: {type(e)} {e}",
+                                file=sys.stderr,
+                            )
+                getattr(sources, "append" if BATCH_PER_DOMAIN else "extend")(batch)
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return sources
 
 
 def list_libraries(start_index, worker_id=None):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     sources = set()
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            doc = Document(_doc)
-            try:
-                if not doc.has_error:
-                    for obj in doc.data:
-                        try:
-                            if doc.get_source_map(obj) is not None and len(doc.get_source_map(obj)) > 0 \
-                                    or doc.version == 1 and doc.is_source_map(obj):
-                                source_map = json.loads(doc.get_source_map(obj)) if doc.get_source_map(obj) is not None else json.loads(obj["body"])
-                                if isinstance(source_map, dict) and "sources" in source_map and isinstance(source_map["sources"], list):
-                                    for source in source_map["sources"]:
-                                        if isinstance(source, str) and "node_modules/" in source:
-                                            last_part = source.rsplit("node_modules/", 1)[-1]
-                                            if len(last_part) > 0 and last_part[0] == "@":
-                                                sources.add("/".join(last_part.split("/", 2)[:2]))
-                                            else:
-                                                sources.add(last_part.split("/", 1)[0])
-                        except CommonErrors as e:
-                            if len(doc.get_source_map(obj)) == 0:
-                                print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
-                            else:
-                                print(
-                                    f"Error for {doc.domain=} {obj['url']=} {doc.get_source_map(obj)[:32]=}: {type(e)} {e}",
-                                    file=sys.stderr,
-                                )
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        doc = Document(_doc)
+        try:
+            if not doc.has_error:
+                for obj in doc.data:
+                    # Fetched once; the error branch below reuses it instead
+                    # of re-reading the blob per format expression
+                    sm = None
+                    try:
+                        if doc.has_source_map(obj) \
+                                or doc.version == 1 and doc.is_source_map(obj):
+                            sm = doc.get_source_map(obj)
+                            srcs = _source_map_sources(sm if sm is not None else obj["body"])
+                            if srcs is not None:
+                                for source in srcs:
+                                    if not isinstance(source, str):
+                                        continue
+                                    # One C-level scan replaces the separate `in` probe
+                                    # plus rsplit over the same string
+                                    _, sep, last_part = source.rpartition("node_modules/")
+                                    if not sep:
+                                        continue
+                                    # The same handful of names (react, lodash, ...) shows up
+                                    # millions of times; interning keeps one copy per name and
+                                    # lets the set dedup on pointer equality
+                                    if last_part[:1] == "@":
+                                        sources.add(sys.intern("/".join(last_part.split("/", 2)[:2])))
+                                    else:
+                                        sources.add(sys.intern(last_part.split("/", 1)[0]))
+                    except CommonErrors as e:
+                        if not sm:
+                            print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
+                        else:
+                            print(
+                                f"Error for {doc.domain=} {obj['url']=} {sm[:32]=}: {type(e)} {e}",
+                                file=sys.stderr,
+                            )
 
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return list(sources)
 
 
 def filter_source_map_sources(start_index, worker_id=None, f=".pnpm"):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     sources = []
-    for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-        if start_index <= i < start_index + STEPSIZE:
-            doc = Document(_doc)
-            batch = []
-            try:
-                if not doc.has_error:
-                    for obj in doc.data:
-                        try:
-                            if doc.get_source_map(obj) is not None and len(doc.get_source_map(obj)) > 0 \
-                                    or doc.version == 1 and doc.is_source_map(obj):
-                                source_map = json.loads(doc.get_source_map(obj)) if doc.get_source_map(obj) is not None else json.loads(obj["body"])
-                                if (isinstance(source_map, dict) and
-                                        "sources" in source_map and
-                                        isinstance(source_map["sources"], list)):
-                                    batch.extend([s for s in source_map["sources"] if isinstance(s, str) and f in s])
-                        except CommonErrors as e:
-                            if len(doc.get_source_map(obj)) == 0:
-                                print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
-                            elif doc.get_source_map(obj)[:10].lstrip().lower() == "<!doctype ":
-                                # Some hosts return HTML 404 pages with 200 OK status code, so ignore the error
-                                pass
-                            else:
-                                print(
-                                    f"Error for {doc.domain=} {obj['url']=} {doc.get_source_map(obj)[:32]=}: {type(e)} {e}",
-                                    file=sys.stderr,
-                                )
-                if len(batch) > 0:
-                    if BATCH_PER_DOMAIN:
-                        sources.append({doc.domain: batch})
-                    else:
-                        sources.extend(batch)
+    done = 0
+    for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+        doc = Document(_doc)
+        batch = []
+        try:
+            if not doc.has_error:
+                for obj in doc.data:
+                    # Fetched once; the error branches below reuse it instead
+                    # of re-reading the blob per format expression
+                    sm = None
+                    try:
+                        if doc.has_source_map(obj) \
+                                or doc.version == 1 and doc.is_source_map(obj):
+                            sm = doc.get_source_map(obj)
+                            srcs = _source_map_sources(sm if sm is not None else obj["body"])
+                            if srcs is not None:
+                                batch.extend([s for s in srcs if isinstance(s, str) and f in s])
+                    except CommonErrors as e:
+                        if not sm:
+                            print(f"Error for {doc.domain=} {obj=}: {type(e)} {e}", file=sys.stderr)
+                        elif sm[:10].lstrip().lower() == "<!doctype ":
+                            # Some hosts return HTML 404 pages with 200 OK status code, so ignore the error
+                            pass
+                        else:
+                            print(
+                                f"Error for {doc.domain=} {obj['url']=} {sm[:32]=}: {type(e)} {e}",
+                                file=sys.stderr,
+                            )
+            if len(batch) > 0:
+                if BATCH_PER_DOMAIN:
+                    sources.append({doc.domain: batch})
+                else:
+                    sources.extend(batch)
 
 
-            except CommonErrors as e:
-                print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
-            finally:
-                with globals()["counter"].get_lock():
-                    globals()["counter"].value += 1
+        except CommonErrors as e:
+            print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        finally:
+            # Progress flushes in batches; per-document writes to the shared
+            # page are needless sync traffic, the parent only polls anyway
+            done += 1
+            if done % 256 == 0:
+                globals()["counters"][worker_id] = done
+    globals()["counters"][worker_id] = done
     return sources
 
 
@@ -318,9 +439,12 @@ def group_source_and_map(doc: Document):
                         else:
                             searching_for_source_file[obj["url"]] = obj["body"]
         elif doc.version == 2:
+            # Raw bytes straight from the store: decoding to str here would
+            # only force a re-encode when the payload is serialized for the
+            # identify server
             mapping_by_url = { obj["url"]: [
-                doc.get_source(obj).decode() if doc.get_source(obj) is not None else None,
-                doc.get_source_map(obj).decode() if doc.get_source_map(obj) is not None else None,
+                doc.get_source(obj),
+                doc.get_source_map(obj),
             ] for obj in doc.data
               if doc.get_type(obj) == "js" and
                  doc.get_source(obj) is not None
@@ -337,7 +461,7 @@ def identify_scaffold(
         appender=lambda l, r, **kwargs: l.append(r),
         cache=False,
 ):
-    shm = multiprocessing.shared_memory.SharedMemory(create=False, name=SHM_NAME)
+    mm = _open_dataset()
 
     PORT = int(os.getenv("PORT", "42000")) + int(worker_id)
     env = {**os.environ, "PORT": str(PORT)}
@@ -345,88 +469,127 @@ def identify_scaffold(
     server = subprocess.Popen(["node", "identification/identify.mjs"], env=env)
     time.sleep(1)
 
+    # Keep-alive session: one TCP connection to the local server instead of a
+    # fresh socket per request
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+    # A few requests in flight keep the node server busy while the next
+    # payload is being prepared; one blocking POST at a time left it idle
+    # for every RTT
+    requests_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
     print(f"Worker {worker_id}: Waiting for server start", file=sys.stderr)
     # Wait for server to start
     for _ in range(1000):
         try:
-            requests.get(f"http://localhost:{PORT}/alive", timeout=0.1)
+            session.get(f"http://localhost:{PORT}/alive", timeout=0.1)
             break
         except (ConnectionRefusedError, requests.Timeout):
             time.sleep(0.1)
     print(f"Worker {worker_id}: Server started", file=sys.stderr)
 
     identification_results = []
+    done = 0
+    # Serialized once; they are identical for every request of this worker
+    headers_blob = orjson.dumps(HEADERS, option=orjson.OPT_SORT_KEYS)
+    post_headers = {**(HEADERS or {}), "Content-Type": "application/json"}
 
     try:
-        for i, _doc in enumerate(bson.decode_iter(shm.buf[:FILESIZE])):
-            if start_index <= i < start_index + STEPSIZE:
-                doc = Document(_doc)
-                batch = []
-                try:
-                    mapping_by_url, searching_for_source_file = {}, {}
-
-                    try:
-                        mapping_by_url, searching_for_source_file = group_source_and_map(doc)
-                    except KeyError as e:
-                        print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+        for _doc in bson.decode_all(_worker_slice(mm, start_index)):
+            doc = Document(_doc)
+            batch = []
+            try:
+                mapping_by_url, searching_for_source_file = {}, {}
 
-                    if doc.version == 1:
-                        open_searches = list(filter(lambda s: "json" not in s, searching_for_source_file))
-                        if len(open_searches) > 0:
+                try:
+                    mapping_by_url, searching_for_source_file = group_source_and_map(doc)
+                except KeyError as e:
+                    print(f"Error for {doc.domain=}: {type(e)} {e}", file=sys.stderr)
+
+                if doc.version == 1:
+                    open_searches = list(filter(lambda s: "json" not in s, searching_for_source_file))
+                    if len(open_searches) > 0:
+                        print(
+                            f"Worker {worker_id} Warning: The following maps are missing a source file ({doc.domain=}): \n"
+                            f"    {'\n    '.join(open_searches)}",
+                            file=sys.stderr,
+                        )
+
+                def identify(job):
+                    url, script, sourcemap = job
+
+                    if cache:
+                        # Streaming hash over the raw parts: no json.dumps of a
+                        # multi-MB source just to derive a key, and blake3
+                        # hashes large inputs much faster than sha1
+                        h = blake3(endpoint.encode())
+                        h.update(headers_blob)
+                        h.update(b"\x00")
+                        if script:
+                            h.update(script if isinstance(script, bytes) else script.encode())
+                        h.update(b"\x00")
+                        if sourcemap:
+                            h.update(sourcemap if isinstance(sourcemap, bytes) else sourcemap.encode())
+                        cache_path = _request_cache_path(h.hexdigest())
+                        if os.path.exists(cache_path):
+                            # zstandard.decompress over module state: identify
+                            # runs on several threads and contexts are not
+                            # thread-safe
+                            with open(cache_path, "rb") as f:
+                                return orjson.loads(zstandard.decompress(f.read()))
+
+                    # orjson only serializes str, so v2 bytes decode exactly
+                    # once, right before the wire
+                    resp = session.post(
+                        f"http://localhost:{PORT}{endpoint}",
+                        data=orjson.dumps({
+                            "source": script.decode() if isinstance(script, bytes) else script,
+                            "map": sourcemap.decode() if isinstance(sourcemap, bytes) else sourcemap,
+                        }),
+                        headers=post_headers,
+                    )
+                    if resp.status_code >= 300:
+                        if resp.status_code == 501:
+                            # Tried to parse JSON => ignore
+                            pass
+                        else:
                             print(
-                                f"Worker {worker_id} Warning: The following maps are missing a source file ({doc.domain=}): \n"
-                                f"    {'\n    '.join(open_searches)}",
-                                file=sys.stderr,
+                                f"Error for {doc.domain=} ({url=}): {resp.status_code} {resp.text}", file=sys.stderr
                             )
+                        return None
+
+                    result = orjson.loads(resp.content)
+                    if cache:
+                        data = orjson.dumps(result)
+                        if len(data) > 2048:
+                            # only cache non-trivial responses
+                            with open(cache_path, "wb") as f:
+                                f.write(zstandard.compress(data, 3))
+                    return result
+
+                jobs = [
+                    (url, script, sourcemap)
+                    for url, (script, sourcemap) in mapping_by_url.items()
+                    if not (requires_sourcemap and sourcemap is None)
+                ]
+                # map keeps result order aligned with mapping_by_url iteration
+                for (url, script, sourcemap), result in zip(jobs, requests_pool.map(identify, jobs)):
+                    if result is not None:
+                        appender(batch, result, domain=doc.domain, url=url, sourcemap=sourcemap)
 
-                    for url, script_and_map in mapping_by_url.items():
-                        script, sourcemap = script_and_map
-                        if requires_sourcemap and sourcemap is None:
-                            continue
-
-                        if cache:
-                            request_hash = hashlib.sha1(json.dumps({"endpoint": endpoint, "headers": HEADERS, "source": script, "map": sourcemap}).encode(), usedforsecurity=False).hexdigest()
-
-                        if cache and os.path.exists(f"{REQUEST_CACHE}/{request_hash}"):
-                            with gzip.open(f"{REQUEST_CACHE}/{request_hash}", "rb") as f:
-                                result = json.load(f)
-                                appender(batch, result, domain=doc.domain, url=url, sourcemap=sourcemap)
-                        else:
-                            resp = requests.post(
-                                f"http://localhost:{PORT}{endpoint}",
-                                json={
-                                    "source": script,
-                                    "map": sourcemap,
-                                },
-                                headers=HEADERS,
-                            )
-                            if resp.status_code >= 300:
-                                if resp.status_code == 501:
-                                    # Tried to parse JSON => ignore
-                                    pass
-                                else:
-                                    print(
-                                        f"Error for {doc.domain=} ({url=}): {resp.status_code} {resp.text}", file=sys.stderr
-                                    )
-                            else:
-                                result = resp.json()
-                                appender(batch, result, domain=doc.domain, url=url, sourcemap=sourcemap)
-                                if cache:
-                                    data = json.dumps(result).encode()
-                                    if len(data) > 1024:
-                                        # only cache non-trivial responses
-                                        with gzip.open(f"{REQUEST_CACHE}/{request_hash}", "wb") as f:
-                                            f.write(data)
-
-                except CommonErrors as e:
-                    import traceback
-                    print(f"Error for {doc.domain=}: {type(e)} {e} {traceback.format_tb(e.__traceback__)}", file=sys.stderr)
-                finally:
-                    identification_results.append(batch)
-                    with globals()["counter"].get_lock():
-                        globals()["counter"].value += 1
+            except CommonErrors as e:
+                import traceback
+                print(f"Error for {doc.domain=}: {type(e)} {e} {traceback.format_tb(e.__traceback__)}", file=sys.stderr)
+            finally:
+                identification_results.append(batch)
+                done += 1
+                if done % 256 == 0:
+                    globals()["counters"][worker_id] = done
 
     finally:
+        globals()["counters"][worker_id] = done
+        requests_pool.shutdown()
         try:
             server.terminate()
             server.wait(1)
@@ -536,9 +699,6 @@ def without_truths(start_index, worker_id=None):
 def main():
     global FILESIZE, TOTAL, WORKER, STEPSIZE, HEADERS, BATCH_PER_FILE, BATCH_PER_DOMAIN
 
-    shm = None
-    counter = multiprocessing.Value("i", 0)
-
     scripts = {
         "get_urls": get_urls,
         "list_libraries": list_libraries,
@@ -625,37 +785,50 @@ def main():
         WORKER = args.worker
         STEPSIZE = TOTAL // WORKER + 1
 
+    # One progress slot per worker; the main loop sums them for display, so
+    # workers never touch a shared lock to report progress
+    counters = multiprocessing.Array("q", WORKER, lock=False)
+
     results = []
     for file in args.files:
-        counter.value = 0
+        counters[:] = [0] * WORKER
+        mm = None
         try:
             FILESIZE = os.stat(file).st_size
-            total_ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
-
-            if FILESIZE + 2e9 > total_ram:
-                raise RuntimeError(f"File with size {FILESIZE} will probably not fit into RAM {total_ram}")
 
-            print(f"Reading {file=} into RAM (this may take a while) ... ")
-            shm = multiprocessing.shared_memory.SharedMemory(create=True, size=FILESIZE, name=SHM_NAME)
-            bs = 1024 * 1024
-            with open(file, mode="rb") as f:
-                for offset in tqdm(range(0, FILESIZE, bs), unit="MByte"):
-                    shm.buf[offset : offset + bs] = f.read(bs)
+            # A read-only mapping replaces the old copy into SharedMemory:
+            # no multi-minute preamble, no double residency of page cache
+            # plus SHM, and no must-fit-in-RAM constraint
+            print(f"Mapping {file=} ... ")
+            dataset = open(file, mode="rb")
+            mm = mmap.mmap(dataset.fileno(), 0, prot=mmap.PROT_READ)
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+
+            print("Indexing documents ...")
+            offsets = [0]
+            pos = 0
+            while pos < FILESIZE and len(offsets) <= TOTAL:
+                (doclen,) = struct.unpack_from("<i", mm, pos)
+                pos += doclen
+                offsets.append(pos)
+            doc_offsets = multiprocessing.Array("q", offsets, lock=False)
 
             print("Fetching sources ...")
 
-            def initializer(ctr):
-                globals()["counter"] = ctr
+            def initializer(ctrs, offs, path):
+                globals()["counters"] = ctrs
+                globals()["doc_offsets"] = offs
+                globals()["dataset_path"] = path
 
             with concurrent.futures.ProcessPoolExecutor(
-                max_workers=WORKER, initializer=initializer, initargs=(counter,)
+                max_workers=WORKER, initializer=initializer, initargs=(counters, doc_offsets, file)
             ) as pool:
                 futures: list[concurrent.futures.Future] = [
                     pool.submit(scripts[args.script], i, n, *args.args) for n, i in enumerate(range(0, TOTAL, STEPSIZE))
                 ]
                 progress = tqdm(total=TOTAL, unit="domains")
-                while counter.value < TOTAL and not all(f.done() for f in futures):
-                    progress.n = counter.value
+                while sum(counters) < TOTAL and not all(f.done() for f in futures):
+                    progress.n = sum(counters)
                     progress.update(0)
                     time.sleep(0.4)
                 progress.close()
@@ -665,15 +838,20 @@ def main():
                     results.extend([future.result() if future.exception() is None else [] for future in futures])
 
         finally:
-            if shm:
-                shm.close()
-                shm.unlink()
-
-    with open("results.json", "w") as f:
-        if BATCH_PER_FILE:
-            json.dump(results, f, indent=2)
-        else:
-            json.dump(list(itertools.chain(*results)), f, indent=2)
+            if mm is not None:
+                mm.close()
+                dataset.close()
+
+    # Serialize element-wise: one dumps over everything holds the full result
+    # list plus its entire serialization in RAM at once
+    with open("results.json", "wb") as f:
+        f.write(b"[")
+        elements = results if BATCH_PER_FILE else itertools.chain.from_iterable(results)
+        for n, element in enumerate(elements):
+            if n:
+                f.write(b",\n")
+            f.write(orjson.dumps(element))
+        f.write(b"]")
 
 
 if __name__ == "__main__":
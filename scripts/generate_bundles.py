@@ -5,6 +5,7 @@ import functools
 import glob
 import os
 import random
+import re
 import shutil
 import subprocess
 import tempfile
@@ -80,14 +81,16 @@ if __name__ == "__main__":
 
     npm_dir = os.getenv("NPM_DIR")
 
+    # Common version strings ("1.0.0", ...) recur across many packages;
+    # caching parses each distinct one once
+    @functools.lru_cache(maxsize=None)
     def semver_conv(a):
         return tuple(map(int, a.split(".")))
 
-    packageVersions = functools.reduce(
-        lambda p, n: (p, p[n[0].replace("+", "/")].append(n[1]))[0],
-        map(lambda e: e.rsplit("@", 1), os.listdir(npm_dir)),
-        collections.defaultdict(list),
-    )
+    packageVersions = collections.defaultdict(list)
+    for entry in os.listdir(npm_dir):
+        name, version = entry.rsplit("@", 1)
+        packageVersions[name.replace("+", "/")].append(version)
 
     for pkg in packageVersions:
         packageVersions[pkg].sort(key=semver_conv, reverse=True)
@@ -128,6 +131,16 @@ if __name__ == "__main__":
             cwd=tmp_dir,
         )
 
+        # One directory listing up front instead of a stat probe per candidate
+        # number per bundle; the set is kept authoritative as bundles are
+        # written, so the probe loop below never touches the disk
+        bundle_file = re.compile(r"bundle-(\d+)\.js$")
+        existing = {
+            int(m.group(1))
+            for f in (os.listdir(args.output_dir) if os.path.isdir(args.output_dir) else [])
+            if (m := bundle_file.match(f))
+        }
+
         n = 0
         for _ in range(args.number if args.number > 0 or not args.one_for_each else len(packages)):
             if n % 500 == 250:
@@ -136,13 +149,13 @@ if __name__ == "__main__":
 
             bundle_contents = sample_packages()
             if not args.one_for_each:
-                while os.path.exists(os.path.join(args.output_dir, f"bundle-{n:04}.js")):
+                while n in existing:
                     n += 1
             else:
                 with open(META_PATH, "a") as f:
                     csv.writer(f).writerow([n] + bundle_contents)
 
-                if os.path.exists(os.path.join(args.output_dir, f"bundle-{n:04}.js")):
+                if n in existing:
                     print("Skipping", bundle_contents[0])
                     n += 1
                     continue
@@ -213,5 +226,6 @@ if __name__ == "__main__":
                 with open(os.path.join(args.output_dir, f"bundle-{n:04}.js"), "w") as f:
                     pass
 
+            existing.add(n)
             n += 1
 
@@ -1,3 +1,4 @@
+import { encode as msgpackEncode } from "@msgpack/msgpack";
 import workerpool from "workerpool";
 
 import "./utils.mjs";
@@ -212,6 +213,9 @@ async function main(basedir) {
 
             const pkgname = url.searchParams.get("pkg");
             const version = url.searchParams.get("version");
+            // msgpack skips the JSON string escaping on both ends; JSON stays
+            // available for older clients
+            const useMsgpack = (request.headers.get("accept") ?? "").includes("application/msgpack");
 
             return new Promise((resolve, reject) =>
                 pool
@@ -219,10 +223,10 @@ async function main(basedir) {
                     .then((worker) => worker.preprocess(basedir, pkgname, version))
                     .then((result) =>
                         resolve(
-                            new Response(JSON.stringify(result.content), {
+                            new Response(useMsgpack ? msgpackEncode(result.content) : JSON.stringify(result.content), {
                                 status: 200,
                                 statusText: "OK",
-                                headers: { "content-type": "application/json" },
+                                headers: { "content-type": useMsgpack ? "application/msgpack" : "application/json" },
                             }),
                         ),
                     )
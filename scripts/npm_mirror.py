@@ -6,16 +6,17 @@ import os
 import shutil
 import sys
 import tarfile
-from concurrent.futures import ProcessPoolExecutor
-from io import BytesIO
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
 
 
-def write_tarball_to_disk(tarball, meta):
-    # Only extract js files
-    with tarfile.open(fileobj=tarball, mode="r:gz") as tf:
-        for ti in tf.getmembers():
+def write_tarball_to_disk(tarball_path, meta):
+    # Only extract js files. Stream mode walks the archive front to back once
+    # and never holds more than one member in memory
+    with tarfile.open(tarball_path, mode="r|gz") as tf:
+        for ti in tf:
             ti: tarfile.TarInfo
             if ti.isfile() and (ti.name[-2:] == "js" or ti.name[-4:] == "json"):
                 reldir = os.path.dirname(
@@ -26,10 +27,10 @@ def write_tarball_to_disk(tarball, meta):
                 os.makedirs(fulldir, exist_ok=True)
 
                 with open(f"{fulldir}/{filename}", "wb") as f:
-                    f.write(tf.extractfile(ti.name).read())
+                    shutil.copyfileobj(tf.extractfile(ti), f)
 
 
-async def process_version(meta, semaphore: asyncio.Semaphore, executor):
+async def process_version(meta, semaphore: asyncio.Semaphore, executor, session: aiohttp.ClientSession):
     meta["name"] = meta["name"].replace("/", "+")
     directory = f"{meta['name']}@{meta['version']}"
     if os.path.exists(directory):
@@ -40,14 +41,23 @@ async def process_version(meta, semaphore: asyncio.Semaphore, executor):
         url = meta["tarball"]
         print(meta)
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as resp:
-                    if resp.status >= 300:
-                        logging.warning(f"Response code {resp.status}, skipping {url}")
-                        return
-
-                    tarball = BytesIO(await resp.read())
-                    await asyncio.get_event_loop().run_in_executor(executor, write_tarball_to_disk, tarball, meta)
+            async with session.get(url) as resp:
+                if resp.status >= 300:
+                    logging.warning(f"Response code {resp.status}, skipping {url}")
+                    return
+
+                # Spool the download to a temp file in chunks: with
+                # cpu_count()*8 transfers in flight, whole tarballs in RAM
+                # add up fast, so only one chunk per transfer is ever
+                # buffered while the extractor reads from disk
+                fd, tarball_path = tempfile.mkstemp(suffix=".tgz")
+                try:
+                    with os.fdopen(fd, "wb") as tmp:
+                        async for chunk in resp.content.iter_chunked(1 << 20):
+                            tmp.write(chunk)
+                    await asyncio.get_event_loop().run_in_executor(executor, write_tarball_to_disk, tarball_path, meta)
+                finally:
+                    os.unlink(tarball_path)
 
         except Exception as e:
             if os.path.exists(directory):
@@ -63,11 +73,17 @@ async def main(wd):
 
     semaphore = asyncio.Semaphore(os.cpu_count() * 8)
 
-    with ProcessPoolExecutor(max_workers=os.cpu_count() - 1) as executor:
-        async with asyncio.TaskGroup() as tg:
-            for versions in libs.values():
-                for meta in versions:
-                    tg.create_task(process_version(meta, semaphore, executor))
+    # One shared session: a session per version opened a fresh TCP+TLS
+    # connection to the registry for every single tarball
+    connector = aiohttp.TCPConnector(limit=os.cpu_count() * 8, limit_per_host=32, ttl_dns_cache=300)
+    # Extraction is gzip inflate plus file writes, both of which release the
+    # GIL, so threads parallelize it without per-task process dispatch
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+            async with asyncio.TaskGroup() as tg:
+                for versions in libs.values():
+                    for meta in versions:
+                        tg.create_task(process_version(meta, semaphore, executor, session))
 
 
 if __name__ == "__main__":
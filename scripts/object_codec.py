@@ -0,0 +1,16 @@
+import lzma
+
+import zstandard
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# One reusable context; constructing a ZstdDecompressor per blob rebuilds its
+# internal tables every time
+_zstd_dctx = zstandard.ZstdDecompressor()
+
+
+def decompress_object(data):
+    # Objects written before the codec switch are lzma frames
+    if data[:4] == ZSTD_MAGIC:
+        return _zstd_dctx.decompress(data)
+    return lzma.decompress(data)
@@ -2,12 +2,12 @@ import argparse
 import concurrent.futures
 import csv
 import functools
-import json
-import lzma
 import os
 from multiprocessing import Lock
 
 import bson
+import orjson
+import zstandard
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -31,9 +31,17 @@ if __name__ == "__main__":
         meta = list(csv.reader(f))
 
     def process_file_set(input_file_set):
-        data = []
         print(f"Current: {input_file_set=}")
         num = int(input_file_set[0].split(".")[0].split("-")[-1], 10)
+
+        # Records are serialized and compressed one at a time, so a file set
+        # never sits in memory as raw bodies, JSON string and blob at once.
+        # zstd reaches a near-LZMA ratio at a fraction of the CPU time and
+        # splits large frames across worker threads
+        cobj = zstandard.ZstdCompressor(level=10, threads=-1).compressobj()
+        compressed = bytearray()
+        compressed += cobj.compress(b"[")
+        length = 0
         for input_file in input_file_set:
             if "LICENSE" in input_file:
                 continue
@@ -45,14 +53,19 @@ if __name__ == "__main__":
                 }
                 if not input_file.endswith(".map"):
                     obj["sourceMapUrl"] = f"local://{input_file}.map"
-                data.append(obj)
+            if length:
+                compressed += cobj.compress(b",")
+            compressed += cobj.compress(orjson.dumps(obj))
+            length += 1
+        compressed += cobj.compress(b"]")
+        compressed += cobj.flush()
 
         doc = {
             "meta": {
                 "domain": f"lab.generated/{meta[num]}",
-                "length": len(data)
+                "length": length
             },
-            "data": lzma.compress(json.dumps(data).encode())
+            "data": bytes(compressed)
         }
 
         return bson.encode(doc)